@@ -1,199 +1,1032 @@
+import io
 import os
+import random
+import asyncio
+import re
+import sys
+import json
+import queue
+import time
+import hashlib
 import zipfile
 import tempfile
 import shutil
+import subprocess
+import threading
 import docker
-from git import Repo
+import httpx
+import requests
+import litellm
+from git import Repo, GitCommandError
 from pathlib import Path
-from litellm import completion
+from litellm import acompletion
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+MANIFEST_FILES = frozenset({
+    'package.json', 'requirements.txt', 'go.mod', 'pom.xml', 'Cargo.toml', 'Gemfile', 'composer.json',
+    'pyproject.toml', 'setup.py', 'Dockerfile',
+    'README.md', 'README.rst', 'README.txt', 'LICENSE',
+})
+# Usual entry point names: listed for the CMD, but not read (they're code, not build config)
+ENTRY_POINT_FILES = frozenset({'main.py', 'app.py', 'index.js'})
+# Folders that are never worth extracting from an uploaded zip
+SKIP_EXTRACT_DIRS = frozenset({'.git', '__pycache__', 'node_modules', '.venv', 'env'})
+# Folders left out of the file map: they add prompt tokens but tell the LLM nothing
+EXCLUDE_DIRS = SKIP_EXTRACT_DIRS | {
+    'venv', 'target', 'build', 'dist', '.next', '.cache', '.mypy_cache', '.pytest_cache', 'vendor',
+}
+VALID_INSTRUCTIONS = ("FROM", "RUN", "COPY", "WORKDIR", "CMD", "ENTRYPOINT", "EXPOSE", "ENV",
+                      "ARG", "LABEL", "USER", "VOLUME", "HEALTHCHECK", "#")
+# Zip, ELF and PDF headers: a "manifest" starting with one of these isn't worth sending
+BINARY_MAGIC = (b'PK\x03\x04', b'\x7fELF', b'%PDF')
+# Any info string (```dockerfile, ```docker, ```Dockerfile, bare ```), so the match starts at the opening fence
+_FENCE_RE = re.compile(r"```[\w.+-]*[ \t]*\n(.*?)(?:```|\Z)", re.S)
+_INSTRUCTION_LINE_RE = re.compile(
+    r"^(?:[ \t]*(?:(?:%s)\b|#)|[ \t]+\S).*$" % "|".join(i for i in VALID_INSTRUCTIONS if i != "#"),
+    re.MULTILINE | re.IGNORECASE
+)
+# Like pip: '#' starts a comment only at the start of a line or after whitespace (not in URL fragments like #egg=)
+_REQ_COMMENT_RE = re.compile(r"(^|\s)#.*")
+_REQ_CONTINUATION_RE = re.compile(r"[ \t]*\\\r?\n\s*")
+MAX_DEPTH = 4  # Deeper folders are listed but not expanded in the file map
+IDENTIFIED_MAX_DEPTH = 3  # Shallower tree once a root manifest names the stack; the file list stays complete
+# Root files that identify the tech stack on their own
+STACK_MANIFESTS = frozenset({
+    'package.json', 'requirements.txt', 'pyproject.toml', 'go.mod', 'pom.xml', 'Cargo.toml', 'composer.json',
+})
+LOG_FLUSH_EVERY = 50  # Build log lines written between stdout flushes
+ZIP_BUFFER_SIZE = 1 << 20  # 1 MiB reads against the archive instead of many small ones
+IN_MEMORY_ZIP_LIMIT = 64 << 20  # Zips up to 64 MiB are read into RAM once
+SHALLOW_CLONE_OPTIONS = ['--depth=1', '--filter=blob:limit=1m', '--single-branch', '--no-tags']
+PARALLEL_EXTRACT_MIN = 50  # Smaller archives are extracted on the calling thread
+PARALLEL_WALK_MIN = 4  # Roots with more top-level folders than this are walked on a thread pool
+WORKSPACE_MARKER = '.autodocker_complete'  # Present once a cached extraction is fully set up
+WORKSPACE_FILE_MAP = '.autodocker_filemap.json'  # Saved file map of a cached extraction
+# Our own files in a cache entry root: never copied into a working dir
+BOOKKEEPING_FILES = frozenset({WORKSPACE_MARKER, WORKSPACE_FILE_MAP})
+FILE_MAP_MAX_LINES = 2000  # Longer file maps / file lists are cut, keeping manifest folders
+CONTEXT_TOKEN_BUDGET = 8000  # Over this, get_context_for_llm drops the tree, then shortens manifests
+MAX_SUMMARY_DEPS = 30  # Dependencies kept per list when summarizing requirements.txt / package.json
+SUMMARY_READ_LIMIT = 64 << 10  # Summarized manifests are read whole (up to 64 KiB) so they can be parsed
+BUILD_ERROR_LOG_SIZE = 8192  # Chars of build log tail sent to the healer (prompt tokens)
+DOCKER_TIMEOUT = 600  # Seconds per Docker API call
+DOCKER_POOL_SIZE = 16  # Keep-alive connections to the daemon
+# Written to the build context when the project has no .dockerignore of its own.
+# Only folders that are never needed inside an image: build/dist/vendor stay, a COPY may want them.
+DOCKERIGNORE_PATTERNS = tuple(f"**/{d}" for d in sorted(SKIP_EXTRACT_DIRS | {'venv', '.mypy_cache', '.pytest_cache'})) + (
+    "**/*.pyc", ".idea", ".vscode", "Dockerfile.cand-*",
+)
+
+
+def _open_zip(path, data=None):
+    """Opens a zip from its in-memory bytes if given, else through a large BufferedReader.
+
+    Returns (ZipFile, file handle).
+    """
+    if data is not None:
+        # BytesIO shares the bytes object, so every handle reads the same buffer
+        handle = io.BytesIO(data)
+    else:
+        handle = io.BufferedReader(open(path, 'rb', buffering=0), buffer_size=ZIP_BUFFER_SIZE)
+    return zipfile.ZipFile(handle, 'r'), handle
+
+
+def _read_manifest(path, limit=1000):
+    """Reads the first limit bytes of a manifest file as text, or None if it's binary.
+
+    Goes straight through os.open/os.read: the read is capped by the OS and no
+    buffered file object or incremental decoder is set up for a short read.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        data = os.read(fd, limit)
+    finally:
+        os.close(fd)
+    if data.startswith(BINARY_MAGIC):
+        return None
+    return data.decode('utf-8', 'ignore')
+
+
+def _summarize_requirements(text):
+    """Keeps pip options (-r, -e, --index-url...) and the first MAX_SUMMARY_DEPS requirements.
+
+    Comments and blank lines are dropped; everything else stays in its original order.
+    Backslash-continued lines are joined first, so a requirement keeps its --hash options.
+    """
+    summary = []
+    reqs = 0
+    for line in _REQ_CONTINUATION_RE.sub(" ", text).splitlines():
+        line = _REQ_COMMENT_RE.sub("", line).strip()
+        if not line:
+            continue
+        if not line.startswith('-'):
+            reqs += 1
+            if reqs > MAX_SUMMARY_DEPS:
+                continue
+        summary.append(line)
+    if reqs > MAX_SUMMARY_DEPS:
+        summary.append(f"# … {reqs - MAX_SUMMARY_DEPS} more requirements omitted")
+    return "\n".join(summary)
+
+
+def _summarize_package_json(text):
+    """Keeps the fields a Dockerfile depends on and the first MAX_SUMMARY_DEPS of each dependency list.
+
+    Returns None if the text isn't a JSON object.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    
+    summary = {k: data[k] for k in ("name", "main", "type", "engines", "packageManager", "scripts", "workspaces") if k in data}
+    for field in ("dependencies", "devDependencies"):
+        deps = data.get(field)
+        if isinstance(deps, dict):
+            top = dict(list(deps.items())[:MAX_SUMMARY_DEPS])
+            if len(deps) > MAX_SUMMARY_DEPS:
+                top["…"] = f"{len(deps) - MAX_SUMMARY_DEPS} more omitted"
+            summary[field] = top
+    return json.dumps(summary, indent=2)
+
+
+MANIFEST_SUMMARIZERS = {
+    'requirements.txt': _summarize_requirements,
+    'package.json': _summarize_package_json,
+}
+
+
+def _load_manifest(path):
+    """Reads a manifest for the LLM: dependency lists are summarized, anything else is cut at 1000 bytes."""
+    summarize = MANIFEST_SUMMARIZERS.get(os.path.basename(path))
+    if summarize is None:
+        return _read_manifest(path)
+    text = _read_manifest(path, SUMMARY_READ_LIMIT)
+    if text is None:
+        return None
+    summary = summarize(text)
+    return summary if summary is not None else text[:1000]
+
+
+def _cap_lines(lines, keep, limit, noun):
+    """Returns at most limit lines plus an omission marker, taking the indices in keep first.
+
+    Lines stay in their original order.
+    """
+    if len(lines) <= limit:
+        return lines
+    chosen = sorted(keep)[:limit]
+    if len(chosen) < limit:
+        taken = set(chosen)
+        rest = (i for i in range(len(lines)) if i not in taken)
+        chosen = sorted(chosen + list(islice(rest, limit - len(chosen))))
+    capped = [lines[i] for i in chosen]
+    capped.append(f"… ({len(lines) - len(chosen)} more {noun} omitted)")
+    return capped
+
+
+def _count_tokens(model, text):
+    """Counts prompt tokens for model, falling back to ~4 chars per token if the tokenizer fails."""
+    try:
+        return litellm.token_counter(model=model or "", text=text)
+    except Exception:
+        return len(text) // 4
+
+
+# File-map indent per depth. The tree stops at MAX_DEPTH, plus one for the "deeper entries omitted" line
+INDENTS = tuple('    ' * level for level in range(MAX_DEPTH + 2))
+
+
+def _sha256_file(path):
+    """Hashes a file in 1 MiB chunks."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(ZIP_BUFFER_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _copy_tree(src, dst):
+    """Copies the cache entry src into the empty folder dst, leaving out our bookkeeping files.
+
+    Real copies, not hard links: edits in a preserved workspace must never reach the cache.
+    """
+    def ignore(folder, names):
+        return BOOKKEEPING_FILES.intersection(names) if folder == src else ()
+
+    shutil.copytree(src, dst, symlinks=True, ignore=ignore, dirs_exist_ok=True)
+
+
+def _member_parts(name):
+    """Splits a zip member name into safe path parts, dropping '..' like ZipFile.extract does."""
+    return [p for p in name.replace('\\', '/').split('/') if p not in ('', '.', '..')]
+
+
+class _BufferPool:
+    """A fixed set of reusable ZIP_BUFFER_SIZE bytearrays shared by extraction workers."""
+
+    def __init__(self, count):
+        self._free = queue.Queue()
+        for _ in range(count):
+            self._free.put(bytearray(ZIP_BUFFER_SIZE))
+
+    def get(self):
+        return self._free.get()
+
+    def put(self, buf):
+        self._free.put(buf)
+
+
+def _copy_member(zip_ref, info, dest, buffers):
+    """Writes one zip member to dest in 1 MiB chunks through a pooled buffer."""
+    buf = buffers.get()
+    try:
+        view = memoryview(buf)
+        with zip_ref.open(info) as src, open(dest, 'wb') as dst:
+            while True:
+                n = src.readinto(buf)
+                if not n:
+                    break
+                dst.write(view[:n])
+    finally:
+        buffers.put(buf)
+
+
+def _scan_dir(path, exclude_dirs):
+    """Reads one folder, returning (files, subfolders) as DirEntry lists. Unreadable folders are empty."""
+    files, subdirs = [], []
+    try:
+        it = os.scandir(path)
+    except OSError:
+        return files, subdirs
+    with it:
+        for entry in it:
+            # is_dir() reuses the type info from the directory read, no extra stat
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in exclude_dirs:
+                    subdirs.append(entry)
+            else:
+                files.append(entry)
+    return files, subdirs
+
+
+def _walk_subtree(folder, level, exclude_dirs):
+    """Yields (level, DirEntry) for folder and everything under it.
+
+    Uses an explicit stack instead of recursion.
+    """
+    stack = deque([(folder, level)])
+    while stack:
+        folder, level = stack.pop()
+        yield level - 1, folder
+        files, subdirs = _scan_dir(folder.path, exclude_dirs)
+        for entry in files:
+            yield level, entry
+        # Reversed so the first subfolder is popped (and listed) first
+        stack.extend((entry, level + 1) for entry in reversed(subdirs))
 
 ## Feature 1 / Task 1
 class WorkspaceManager:
+    CACHE_DIR = Path.home() / ".cache" / "autodocker" / "workspaces"
+    CACHE_TTL = 7 * 24 * 60 * 60  # Extractions unused for a week are deleted
+
     def __init__(self, source_path):
         self.source_path = source_path # This can be a URL or a Path
+        self.is_git = source_path.startswith("http")
+        self.zip_path = None if self.is_git else source_path
         self.temp_dir = None
         self.file_map = []
         self.actual_files = []
+        self.root_files = []
+        self.entry_points = []
+        self.manifest_contents = {}
+        self._cached_context = None
+        self._context_fingerprint = None
+        self._context_model = None
 
     def setup(self):
-        """Extracts zip to a temp directory and maps the structure."""
-        self.temp_dir = tempfile.mkdtemp(prefix="auto_docker_")
-        
-        with zipfile.ZipFile(self.zip_path, 'r') as zip_ref:
-            zip_ref.extractall(self.temp_dir)
+        """Extracts zip to a temp directory and maps the structure (or clones, for a URL).
+
+        The extraction and its file map are cached under CACHE_DIR by the zip's
+        SHA-256 and never modified; each run copies them into its own mkdtemp
+        working dir, so repeat runs on the same zip skip both extraction and the walk.
+        """
+        if self.is_git:
+            return self.setup_from_github(self.source_path)
         
-        self._build_file_map()
+        entry = self._cache_entry(_sha256_file(self.zip_path))
+        self.temp_dir = tempfile.mkdtemp(prefix="auto_docker_")
+        _copy_tree(entry, self.temp_dir)
+        if not self._load_file_map(entry):
+            self._build_file_map()
         return self.temp_dir
 
-    def _build_file_map(self):
-        """Scans the directory and creates a string representation of the project."""
-        exclude_dirs = {'.git', '__pycache__', 'node_modules', '.venv', 'env'}
+    def _cache_entry(self, digest):
+        """Returns the cache entry for a zip digest, extracting and mapping it first if needed.
+
+        Entries are built in a private staging dir and renamed into place, so a
+        concurrent or interrupted run never sees a half-built one.
+        """
+        self.CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        os.chmod(self.CACHE_DIR, 0o700)
+        self._evict_stale()
+        entry = str(self.CACHE_DIR / digest[:16])
+        if os.path.exists(os.path.join(entry, WORKSPACE_MARKER)):
+            os.utime(entry) # Last use, for _evict_stale
+            return entry
         
-        lines = []
-        self.actual_files = []
+        # mkdtemp creates the folder 0700, which the rename keeps
+        self.temp_dir = tempfile.mkdtemp(prefix=f"{digest[:16]}.", suffix=".staging", dir=self.CACHE_DIR)
+        try:
+            self._extract()
+            self._build_file_map()
+            self._save_file_map()
+            open(os.path.join(self.temp_dir, WORKSPACE_MARKER), 'w').close()
+            try:
+                os.rename(self.temp_dir, entry)
+            except OSError:
+                pass # Another run on the same zip got there first; use its entry
+        finally:
+            shutil.rmtree(self.temp_dir, ignore_errors=True) # Gone already if the rename won
+        return entry
+
+    def _evict_stale(self):
+        """Deletes cache entries, and staging dirs left by killed runs, untouched for CACHE_TTL."""
+        cutoff = time.time() - self.CACHE_TTL
+        with os.scandir(self.CACHE_DIR) as it:
+            for entry in it:
+                try:
+                    if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                except OSError:
+                    pass
+
+    def _save_file_map(self):
+        """Stores the file map and manifest contents next to the extracted tree."""
+        state = {
+            "file_map": self.file_map,
+            "actual_files": self.actual_files,
+            "root_files": self.root_files,
+            "entry_points": self.entry_points,
+            "manifest_contents": self.manifest_contents,
+        }
+        with open(os.path.join(self.temp_dir, WORKSPACE_FILE_MAP), 'w') as f:
+            json.dump(state, f)
+
+    def _load_file_map(self, folder):
+        """Restores what _save_file_map stored in folder. Returns False if it is missing or unreadable."""
+        try:
+            with open(os.path.join(folder, WORKSPACE_FILE_MAP)) as f:
+                state = json.load(f)
+            self.file_map = state["file_map"]
+            self.actual_files = state["actual_files"]
+            self.root_files = state["root_files"]
+            self.entry_points = state["entry_points"]
+            self.manifest_contents = state["manifest_contents"]
+        except (OSError, ValueError, KeyError):
+            return False
+        self._cached_context = None
+        return True
+
+    def _extract(self):
+        """Extracts the zip into temp_dir, skipping VCS / venv / cache folders."""
+        # Small archives are loaded once so extraction makes no per-read syscalls
+        zip_data = None
+        if os.path.getsize(self.zip_path) <= IN_MEMORY_ZIP_LIMIT:
+            with open(self.zip_path, 'rb') as f:
+                zip_data = f.read()
         
-        for root, dirs, files in os.walk(self.temp_dir):
-            # Filter out excluded directories
-            dirs[:] = [d for d in dirs if d not in exclude_dirs]
-            
-            level = os.path.relpath(root, self.temp_dir).count(os.sep)
-            indent = ' ' * 4 * level
-            folder_name = os.path.basename(root)
+        zip_ref, zip_file = _open_zip(self.zip_path, zip_data)
+        with zip_file, zip_ref:
+            members = []
+            folders = set()
+            for info in zip_ref.infolist():
+                parts = _member_parts(info.filename)
+                if not parts or any(p in SKIP_EXTRACT_DIRS for p in parts[:-1]):
+                    continue
+                if info.is_dir():
+                    if parts[-1] not in SKIP_EXTRACT_DIRS:
+                        folders.add(os.path.join(self.temp_dir, *parts))
+                    continue
+                folders.add(os.path.join(self.temp_dir, *parts[:-1]))
+                members.append((info, os.path.join(self.temp_dir, *parts)))
             
-            if folder_name:
-                lines.append(f"{indent}📂 {folder_name}/")
+            # Create every folder up front so the workers never race on makedirs
+            for folder in folders:
+                os.makedirs(folder, exist_ok=True)
             
-            sub_indent = ' ' * 4 * (level + 1)
-            for f in files:
-                lines.append(f"{sub_indent}📄 {f}")
-                rel_path = os.path.relpath(os.path.join(root, f), self.temp_dir)
+            if len(members) < PARALLEL_EXTRACT_MIN:
+                # Spinning up a pool costs more than it saves on a handful of files
+                buffers = _BufferPool(1)
+                for info, dest in members:
+                    _copy_member(zip_ref, info, dest, buffers)
+            else:
+                self._extract_parallel(members, zip_data)
+
+    def _extract_parallel(self, members, zip_data=None):
+        """Extracts (ZipInfo, dest) pairs across a thread pool (zlib releases the GIL)."""
+        local = threading.local()
+        handles = []
+        workers = os.cpu_count() or 1
+        buffers = _BufferPool(workers)
+
+        def extract(member):
+            # Each worker gets its own ZipFile so they don't fight over one file offset
+            zip_ref = getattr(local, 'zip_ref', None)
+            if zip_ref is None:
+                zip_ref, zip_file = _open_zip(self.zip_path, zip_data)
+                local.zip_ref = zip_ref
+                handles.append((zip_ref, zip_file))
+            _copy_member(zip_ref, *member, buffers)
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(extract, members))
+        finally:
+            for zip_ref, zip_file in handles:
+                zip_ref.close()
+                zip_file.close()
+
+    def _build_file_map(self):
+        """Scans the directory and creates a string representation of the project.
+
+        Also records the root-level files and reads every manifest file it passes,
+        so that get_context_for_llm never touches the disk. The tree stops
+        expanding folders at max_depth, but the file list and the manifest scan
+        cover every folder outside EXCLUDE_DIRS. The map is capped at
+        FILE_MAP_MAX_LINES, keeping root entries and the folders that hold
+        manifests over everything else.
+        """
+        # Fixed root label: a random temp dir name would change the prompt (and its cache key) every run
+        lines = ["📂 ./"]
+        keep = {0}
+        folder_lines = [] # Line index of the current folder at each depth
+        prefix_len = len(os.path.join(self.temp_dir, ''))
+        self.actual_files = []
+        self.root_files = []
+        self.entry_points = []
+        self._cached_context = None
+        pending_reads = {}
+        
+        # A root manifest already names the stack, so the tree can stop a level sooner.
+        # Only the displayed tree: the file list still has every source file a COPY may need.
+        stack_identified = any(os.path.isfile(os.path.join(self.temp_dir, name)) for name in STACK_MANIFESTS)
+        max_depth = IDENTIFIED_MAX_DEPTH if stack_identified else MAX_DEPTH
+        omitted = "… (deeper entries omitted, stack already identified)" if stack_identified else "… (deeper entries omitted)"
+        
+        # Manifest reads are I/O bound, so they run in a thread pool while the walk carries on
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for level, entry in self._iter_tree(EXCLUDE_DIRS):
+                shown = level <= max_depth # Deeper entries are left out of the tree only
+                if level == 1:
+                    keep.add(len(lines))
+                
+                if entry.is_dir(follow_symlinks=False):
+                    if shown:
+                        del folder_lines[level - 1:]
+                        folder_lines.append(len(lines))
+                        lines.append(f"{INDENTS[level]}📂 {entry.name}/")
+                        if level == max_depth:
+                            lines.append(f"{INDENTS[level + 1]}{omitted}")
+                    continue
+                
+                # entry.path always starts with temp_dir, so slicing is enough (relpath costs syscalls)
+                rel_path = entry.path[prefix_len:]
                 self.actual_files.append(rel_path)
+                if level == 1:
+                    self.root_files.append(entry.name)
+                if entry.name in MANIFEST_FILES:
+                    if shown:
+                        keep.add(len(lines))
+                    keep.update(folder_lines[:level - 1])
+                    pending_reads[rel_path] = executor.submit(_load_manifest, entry.path)
+                elif entry.name in ENTRY_POINT_FILES:
+                    if shown:
+                        keep.add(len(lines))
+                    self.entry_points.append(rel_path)
+                if shown:
+                    lines.append(f"{INDENTS[level]}📄 {entry.name}")
         
-        self.file_map = "\n".join(lines)
+        self.manifest_contents = {}
+        for path, read in pending_reads.items():
+            content = read.result()
+            if content is not None:
+                self.manifest_contents[path] = content
+        self.file_map = "\n".join(_cap_lines(lines, keep, FILE_MAP_MAX_LINES, "entries"))
 
-    def get_context_for_llm(self):
-        """Returns the file map and content of key manifest files."""
-        context = f"Project Structure:\n{self.file_map}\n\n"
+    def _iter_tree(self, exclude_dirs):
+        """Yields (level, DirEntry) pairs depth-first: a folder's files, then each subfolder.
 
-        context += "=== ROOT DIRECTORY FILES ===\n"
-        root_files = [f for f in os.listdir(self.temp_dir) if os.path.isfile(os.path.join(self.temp_dir, f))]
-        for f in root_files:
-            context += f"  - {f}\n"
-        context += "\n"
+        When the root has more than PARALLEL_WALK_MIN top-level folders, their
+        subtrees are scanned on a thread pool (directory reads are I/O bound) and
+        yielded in the same order a serial walk would produce.
+        """
+        files, subdirs = _scan_dir(self.temp_dir, exclude_dirs)
+        for entry in files:
+            yield 1, entry
         
-        context += "=== ALL FILES THAT ACTUALLY EXIST ===\n"
-        context += "\n".join(self.actual_files)
-        context += "\n\n"
+        if len(subdirs) <= PARALLEL_WALK_MIN:
+            for folder in subdirs:
+                yield from _walk_subtree(folder, 2, exclude_dirs)
+            return
         
-        manifests = ['package.json', 'requirements.txt', 'go.mod', 'pom.xml', 
-                    'main.py', 'app.py', 'index.js', 'pyproject.toml', 'setup.py',
-                    'README.md', 'README.rst', 'README.txt', 'LICENSE']
+        workers = min(32, (os.cpu_count() or 1) * 4)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # map() returns results in submission order, so the file map stays deterministic
+            subtrees = executor.map(lambda folder: list(_walk_subtree(folder, 2, exclude_dirs)), subdirs)
+            for subtree in subtrees:
+                yield from subtree
+
+    def _manifest_fingerprint(self):
+        """Cheap change detector for the workspace: the sum of the manifests' mtimes."""
+        total = 0
+        for rel_path in self.manifest_contents:
+            try:
+                total += os.stat(os.path.join(self.temp_dir, rel_path)).st_mtime_ns
+            except OSError:
+                pass
+        return total
+
+    def get_context_for_llm(self, model=None):
+        """Returns the file map and content of key manifest files.
+
+        If the context is over CONTEXT_TOKEN_BUDGET tokens for the model, the
+        file tree is dropped first, then the manifest excerpts are shortened.
+        The result is cached, since every heal round asks for the same context.
+        It is rebuilt only if a manifest changed on disk since it was made.
+        """
+        fingerprint = self._manifest_fingerprint()
+        if self._cached_context is not None:
+            if fingerprint != self._context_fingerprint:
+                self._build_file_map()
+                fingerprint = self._manifest_fingerprint()
+            elif model == self._context_model:
+                return self._cached_context
         
-        found_manifests = []
-        missing_manifests = []
+        context = self._assemble_context()
+        if _count_tokens(model, context) > CONTEXT_TOKEN_BUDGET:
+            # The tree repeats what the file list says, so it is the cheapest thing to lose
+            context = self._assemble_context(include_tree=False)
+            for manifest_limit in (500, 200):
+                if _count_tokens(model, context) <= CONTEXT_TOKEN_BUDGET:
+                    break
+                context = self._assemble_context(include_tree=False, manifest_limit=manifest_limit)
         
-        context += "Key File Contents:\n"
-        for root, _, files in os.walk(self.temp_dir):
-            for f in files:
-                if f in manifests:
-                    found_manifests.append(f)
-                    file_path = os.path.join(root, f)
-                    with open(file_path, 'r', errors='ignore') as content:
-                        context += f"--- {f} ---\n{content.read(1000)}\n"
+        self._cached_context = context
+        self._context_fingerprint = fingerprint
+        self._context_model = model
+        return self._cached_context
+
+    def _assemble_context(self, include_tree=True, manifest_limit=None):
+        """Builds the context text, optionally without the tree and with manifests cut to manifest_limit chars."""
+        # Collect the sections in a list and join once, rather than growing a string
+        if include_tree:
+            parts = [f"Project Structure:\n{self.file_map}\n"]
+        else:
+            parts = ["Project Structure: omitted to fit the token budget, see the file list below.\n"]
+
+        parts.append("=== ROOT DIRECTORY FILES ===")
+        parts.extend(f"  - {f}" for f in self.root_files)
+        parts.append("")
         
-        missing_manifests = [m for m in manifests if m not in found_manifests]
+        # Root files and manifests are what a Dockerfile COPYs, so they survive the cap
+        keep = {i for i, path in enumerate(self.actual_files)
+                if os.sep not in path or os.path.basename(path) in MANIFEST_FILES}
+        parts.append("=== ALL FILES THAT ACTUALLY EXIST ===")
+        parts.extend(_cap_lines(self.actual_files, keep, FILE_MAP_MAX_LINES, "files"))
+        parts.append("")
+        
+        if self.entry_points:
+            parts.append("=== LIKELY ENTRY POINTS ===")
+            parts.extend(f"  - {path}" for path in self.entry_points)
+            parts.append("")
+        
+        # Manifests were read during _build_file_map, so this is pure string assembly
+        found_manifests = MANIFEST_FILES.intersection(map(os.path.basename, self.actual_files))
+        parts.append("Key File Contents:")
+        parts.extend(f"--- {path} ---\n{content[:manifest_limit]}" for path, content in self.manifest_contents.items())
+        
+        missing_manifests = sorted(MANIFEST_FILES - found_manifests)
         if missing_manifests:
-            context += "\n=== MISSING STANDARD FILES ===\n"
-            context += f"The following common files do NOT exist: {', '.join(missing_manifests)}\n"
-            context += "Do NOT attempt to COPY these files in the Dockerfile!\n\n"
+            parts.append("\n=== MISSING STANDARD FILES ===")
+            parts.append(f"The following common files do NOT exist: {', '.join(missing_manifests)}")
+            parts.append("Do NOT attempt to COPY these files in the Dockerfile!\n")
         
-        return context
+        return "\n".join(parts)
+
+    def write_dockerignore(self):
+        """Writes a default .dockerignore so the daemon isn't sent VCS, venv and cache folders.
+
+        A .dockerignore that came with the project is left alone. Returns True if one was written.
+        """
+        path = os.path.join(self.temp_dir, ".dockerignore")
+        if os.path.exists(path):
+            return False
+        with open(path, "w") as f:
+            f.write("\n".join(DOCKERIGNORE_PATTERNS) + "\n")
+        return True
 
     def cleanup(self):
-        """Deletes the temporary workspace."""
+        """Deletes the temporary workspace in the background.
+
+        The folder is renamed out of the way first (atomic, same filesystem), so
+        the workspace is gone immediately even though the actual unlinking runs
+        in the background. On POSIX that is a detached `rm -rf`, which keeps going
+        after autodocker exits; elsewhere it is shutil.rmtree on a daemon thread,
+        and a leftover folder sits in the system temp dir for the OS to reap.
+        """
+        self._cached_context = None
         if self.temp_dir and os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
+            doomed = f"{self.temp_dir}.deleting"
+            try:
+                os.rename(self.temp_dir, doomed)
+            except OSError:
+                doomed = self.temp_dir
+            if sys.platform != "win32":
+                subprocess.Popen(
+                    ["rm", "-rf", "--", doomed],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    start_new_session=True # Not killed with us on Ctrl+C
+                )
+                return
+            threading.Thread(
+                target=shutil.rmtree,
+                args=(doomed,),
+                kwargs={'ignore_errors': True},
+                daemon=True
+            ).start()
 
     def setup_from_github(self, repo_url):
         """Clones a GitHub repo to a temp directory."""
         self.temp_dir = tempfile.mkdtemp(prefix="autodocker_git_")
         try:
-            Repo.clone_from(repo_url, self.temp_dir)
+            try:
+                # Only the tip tree matters for a Dockerfile, so skip history, other refs, tags and big blobs
+                Repo.clone_from(repo_url, self.temp_dir, multi_options=SHALLOW_CLONE_OPTIONS)
+            except GitCommandError:
+                # Some servers don't support partial clone filters; fall back to a full clone
+                shutil.rmtree(self.temp_dir, ignore_errors=True)
+                os.makedirs(self.temp_dir, exist_ok=True)
+                Repo.clone_from(repo_url, self.temp_dir)
+            # Only the working tree is needed from here on; dropping .git also keeps it out of the build context
+            shutil.rmtree(os.path.join(self.temp_dir, '.git'), ignore_errors=True)
             self._build_file_map() # Build the tree for the LLM
             return self.temp_dir
         except Exception as e:
             raise Exception(f"Git Clone Failed: {e}")
 
 ## Feature 1 / Task 2
+# System prompts are module constants: identical on every call, which is what lets
+# providers with prompt caching reuse them across generate and heal rounds.
+GENERATE_SYSTEM_PROMPT = (
+    "You are an expert DevOps Engineer. Your task is to generate a Dockerfile based on a project structure.\n"
+    "STRICT REQUIREMENTS:\n"
+    "1. Use MULTI-STAGE builds to keep the image small.\n"
+    "2. Use 'alpine' or 'slim' variants as the final runtime base for security.\n"
+    "   Avoid using Distroless images (gcr.io/distroless) as they often have inconsistent tagging.\n"
+    "   Stick to official Docker Hub images like 'python:3.9-slim' or 'python:3.9-alpine' for reliability.\n"
+    "3. Optimize for layer caching (copy requirements/package files first):\n"
+    "   - COPY only the dependency manifests, install dependencies, THEN 'COPY . .' the source,\n"
+    "     so source edits don't re-run the install step.\n"
+    "   - apt: 'apt-get update && apt-get install -y --no-install-recommends ... && rm -rf /var/lib/apt/lists/*' in ONE RUN.\n"
+    "   - pip: 'pip install --no-cache-dir -r requirements.txt'. node: 'npm ci' after copying package*.json\n"
+    "     ('npm install' if there is no package-lock.json). go: 'go mod download' after copying go.mod (and go.sum if listed).\n"
+    "   - Do NOT use 'RUN --mount=...' or a '# syntax=' line: the image is built with the classic builder, not BuildKit.\n"
+    "4. Ensure the entry point is correctly identified from the file list.\n"
+    "5. CRITICAL: Only COPY files that are listed in 'FILES THAT ACTUALLY EXIST' section.\n"
+    "6. If requirements.txt is missing but pyproject.toml or setup.py exists, use 'pip install .' instead.\n"
+    "7. IMPORTANT COPYING STRATEGY:\n"
+    "   - If you see pyproject.toml or setup.py, modern build backends (flit, setuptools, poetry) "
+    "often require README files (README.md, README.rst) and LICENSE files to install.\n"
+    "   - For build contexts: Either use 'COPY . .' to copy everything OR explicitly COPY all "
+    "necessary files including README*, LICENSE*, and any config files.\n"
+    "   - Check the ROOT DIRECTORY FILES list to see what documentation files exist.\n"
+    "8. Return ONLY the content of the Dockerfile. No markdown code blocks, no explanations."
+)
+
+HEAL_BUILD_SYSTEM_PROMPT = (
+    "You are a Senior DevOps Engineer. A Dockerfile failed to build.\n"
+    "CRITICAL RULES:\n"
+    "1. Only COPY files that are explicitly listed in 'FILES THAT ACTUALLY EXIST' section.\n"
+    "2. If a file like requirements.txt is missing, do NOT attempt to use it.\n"
+    "3. Look for alternatives: pyproject.toml, setup.py, or use 'pip install .' for Python projects.\n"
+    "4. If the error mentions a missing file, CHECK if it's in the 'MISSING STANDARD FILES' list.\n"
+    "5. IMPORTANT: If the error is 'FileNotFoundError' for README.rst, README.md, LICENSE, or similar:\n"
+    "   - These files exist in the project but weren't copied into the Docker image.\n"
+    "   - Check the ROOT DIRECTORY FILES list to see what needs to be copied.\n"
+    "   - Use 'COPY . .' to copy everything OR explicitly add 'COPY README.* ./' and 'COPY LICENSE ./'.\n"
+    "6. Modern Python build backends (flit, poetry, setuptools) often require README and LICENSE files.\n"
+    "7. If the error says a flag or '--mount' requires BuildKit, rewrite that step without BuildKit-only syntax.\n"
+    "8. Return ONLY the fixed Dockerfile content. No explanations, no markdown, no 'Here is the fix' preamble."
+)
+
+HEAL_RUNTIME_SYSTEM_PROMPT = (
+    "You are a Senior DevOps Engineer. A Docker image BUILT successfully, but FAILED when running.\n"
+    "CRITICAL ANALYSIS REQUIRED:\n"
+    "1. Determine if this is a LIBRARY (like Flask, Bottle, Django libs) or an APPLICATION.\n"
+    "2. For LIBRARIES: The CMD should be a simple validation like 'python -c \"import X; print(X.__version__)\"'\n"
+    "3. For APPLICATIONS: Fix the entry point (e.g., correct the path to main.py, add ENTRYPOINT).\n"
+    "4. Common runtime errors:\n"
+    "   - 'executable file not found' → Use full command: CMD [\"python\", \"script.py\"] not CMD [\"script.py\"]\n"
+    "   - 'No application entry point specified' → Library project, use import test\n"
+    "   - 'ModuleNotFoundError' → Missing dependency or wrong WORKDIR\n"
+    "   - 'Permission denied' → Add executable permissions or fix user\n"
+    "5. Return ONLY the fixed Dockerfile content. No explanations, no markdown, no preamble."
+)
+
+# Models whose providers honor Anthropic-style cache_control markers
+CACHE_CONTROL_PREFIXES = ("anthropic/", "claude-")
+# One temperature per extra candidate: the first stays near-deterministic, later ones explore
+CANDIDATE_TEMPERATURES = (0.1, 0.4, 0.7, 0.9)
+ALTERNATIVE_TEMPERATURE = 0.7  # Speculative fallback: different enough from the 0.2 first answer to be worth a build
+
+
+def _retry_after(error):
+    """Returns the provider's Retry-After hint in seconds, or None if it didn't send one."""
+    headers = getattr(error, 'headers', None)
+    response = getattr(error, 'response', None)
+    if not headers and response is not None:
+        headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after') or headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None # Missing, or an HTTP date rather than a number of seconds
+
+
+_loop_singleton = None
+
+
+def _get_loop():
+    """Returns the event loop the sync LLMArchitect methods run on.
+
+    Every sync call goes through this one loop, so the pooled async HTTP
+    connections stay bound to the loop that opened them.
+    """
+    global _loop_singleton
+    if _loop_singleton is None or _loop_singleton.is_closed():
+        _loop_singleton = asyncio.new_event_loop()
+    return _loop_singleton
+
+
 class LLMArchitect:
-    def __init__(self, model="groq/llama-3.1-8b-instant"): # Defaulting to groq
+    CACHE_DIR = Path.home() / ".cache" / "autodocker" / "llm"
+    CACHE_TTL = 30 * 24 * 60 * 60  # Cached Dockerfiles expire after 30 days
+
+    def __init__(self, model="groq/llama-3.1-8b-instant", use_cache=True): # Defaulting to groq
         self.model = model
+        self.use_cache = use_cache # False still writes fresh answers, it just never reads old ones
+
+        # Reuse one keep-alive connection pool across generate -> heal -> retry calls,
+        # instead of paying a fresh TCP + TLS handshake on every acompletion()
+        if litellm.aclient_session is None:
+            litellm.aclient_session = httpx.AsyncClient(
+                timeout=60,
+                limits=httpx.Limits(max_keepalive_connections=4)
+            )
+
+        # Cleaned answers by request, so a heal loop that repeats itself doesn't re-ask the LLM
+        self._llm_cache = {}
+
+    def _run(self, coro):
+        """Runs a coroutine to completion for the sync wrappers."""
+        return _get_loop().run_until_complete(coro)
+
+    def _cache_key(self, system_prompt, user_prompt):
+        """Content-addresses a request by model and prompts."""
+        payload = (self.model + system_prompt + user_prompt).encode()
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    def _cache_get(self, key):
+        """Returns a cached Dockerfile, or None if it is missing, expired or caching is off."""
+        if not self.use_cache:
+            return None
+        path = self.CACHE_DIR / key
+        try:
+            if time.time() - path.stat().st_mtime > self.CACHE_TTL:
+                return None
+            return path.read_text()
+        except OSError:
+            return None
+
+    def _cache_put(self, key, content):
+        """Stores a Dockerfile in the cache. Written to a temp file first so readers never see half of it."""
+        try:
+            self.CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.CACHE_DIR / f"{key}.{os.getpid()}.tmp"
+            tmp_path.write_text(content)
+            os.replace(tmp_path, self.CACHE_DIR / key)
+        except OSError:
+            pass # Caching is best effort
 
-    def _ask_llm_with_retry(self, messages):
-        """Retries the LLM call if it hits a rate limit."""
-        import time
-        import litellm
+    def _system_message(self, prompt):
+        """Builds the system message, marked cacheable for providers that support cache_control."""
+        if self.model.startswith(CACHE_CONTROL_PREFIXES):
+            return {
+                "role": "system",
+                "content": [{"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}}]
+            }
+        return {"role": "system", "content": prompt}
+
+    async def _acomplete(self, system_prompt, user_prompt):
+        """Returns the cleaned Dockerfile for a request.
+
+        Exact repeats are answered from memory, then from the disk cache, so the
+        same failure seen again (in this run or a later one) doesn't re-ask the LLM.
+        """
+        key = self._cache_key(system_prompt, user_prompt)
+        if key in self._llm_cache:
+            return self._llm_cache[key]
         
-        max_retries = 3
+        content = self._cache_get(key)
+        if content is None:
+            messages = [
+                self._system_message(system_prompt),
+                {"role": "user", "content": user_prompt}
+            ]
+            response = await self._acall(messages)
+            content = self._clean_llm_output(response.choices[0].message.content)
+            self._cache_put(key, content)
+        self._llm_cache[key] = content
+        return content
+
+    async def _acall(self, messages, stream=False, temperature=0.2):
+        """Retries the LLM call with exponential backoff and jitter if it hits a rate limit."""
+        max_retries = 8
+        base_delay, max_delay, jitter = 1.0, 60.0, 1.0
         
         for attempt in range(max_retries):
             try:
                 # Try to get the response
-                response = completion(
+                response = await acompletion(
                     model=self.model,
                     messages=messages,
-                    temperature=0.2
+                    temperature=temperature,
+                    stream=stream
                 )
                 return response
-            except litellm.RateLimitError:
-                # If we get a rate limit, WAIT instead of crashing
-                wait_time = 60  # Wait 60 seconds
-                print(f"\n[Rate Limit Hit] Pausing for {wait_time} seconds before retry {attempt + 1}/{max_retries}...")
-                time.sleep(wait_time)
+            except litellm.RateLimitError as e:
+                # If we get a rate limit, WAIT instead of crashing (without blocking other requests).
+                # Short bursts clear in a second or two; sustained limits back off up to a minute.
+                wait_time = min(max_delay, base_delay * 2 ** attempt) + random.uniform(0, jitter)
+                retry_after = _retry_after(e)
+                if retry_after is not None:
+                    wait_time = max(wait_time, retry_after)
+                print(f"\n[Rate Limit Hit] Pausing for {wait_time:.1f} seconds before retry {attempt + 1}/{max_retries}...")
+                await asyncio.sleep(wait_time)
             except Exception as e:
                 # If it's another error, crash as normal
                 raise e
         
-        raise Exception("Failed after 3 retries due to rate limits.")
-
-    def generate_dockerfile(self, project_context):
-        """Sends project context to LLM and extracts the Dockerfile code."""
-        
-        system_prompt = (
-            "You are an expert DevOps Engineer. Your task is to generate a Dockerfile based on a project structure.\n"
-            "STRICT REQUIREMENTS:\n"
-            "1. Use MULTI-STAGE builds to keep the image small.\n"
-            "2. Use 'alpine' or 'slim' variants as the final runtime base for security.\n"
-            "   Avoid using Distroless images (gcr.io/distroless) as they often have inconsistent tagging.\n"
-            "   Stick to official Docker Hub images like 'python:3.9-slim' or 'python:3.9-alpine' for reliability.\n"
-            "3. Optimize for layer caching (copy requirements/package files first).\n"
-            "4. Ensure the entry point is correctly identified from the file list.\n"
-            "5. CRITICAL: Only COPY files that are listed in 'FILES THAT ACTUALLY EXIST' section.\n"
-            "6. If requirements.txt is missing but pyproject.toml or setup.py exists, use 'pip install .' instead.\n"
-            "7. IMPORTANT COPYING STRATEGY:\n"
-            "   - If you see pyproject.toml or setup.py, modern build backends (flit, setuptools, poetry) "
-            "often require README files (README.md, README.rst) and LICENSE files to install.\n"
-            "   - For build contexts: Either use 'COPY . .' to copy everything OR explicitly COPY all "
-            "necessary files including README*, LICENSE*, and any config files.\n"
-            "   - Check the ROOT DIRECTORY FILES list to see what documentation files exist.\n"
-            "8. Return ONLY the content of the Dockerfile. No markdown code blocks, no explanations."
-        )
+        raise Exception(f"Failed after {max_retries} retries due to rate limits.")
+
+    def generate_dockerfile(self, project_context, output_path=None):
+        """Sync wrapper around agenerate_dockerfile."""
+        return self._run(self.agenerate_dockerfile(project_context, output_path))
+
+    async def generate_dockerfiles(self, contexts):
+        """Generates a Dockerfile for each project context concurrently."""
+        return await asyncio.gather(*(self.agenerate_dockerfile(c) for c in contexts))
 
+    def _generate_messages(self, project_context):
+        """Builds the generate request for a project context."""
         user_prompt = f"Analyze this project and create the most optimized Dockerfile possible:\n\n{project_context}"
-        messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
+        return [
+            self._system_message(GENERATE_SYSTEM_PROMPT),
+            {"role": "user", "content": user_prompt}
         ]
 
+    def speculate_build(self, build, project_context, current_dockerfile):
+        """Sync wrapper around aspeculate_build."""
+        return self._run(self.aspeculate_build(build, project_context, current_dockerfile))
+
+    async def aspeculate_build(self, build, project_context, current_dockerfile):
+        """Runs the blocking build() in a thread while a fallback Dockerfile is generated.
+
+        Returns (result, error, alternative). If the build succeeds, the speculative
+        request is cancelled and error and alternative are None. If it fails, error is
+        the exception and alternative is a different Dockerfile, or None.
+        """
+        speculative = asyncio.ensure_future(self.agenerate_alternative(project_context, current_dockerfile))
+        try:
+            result = await asyncio.to_thread(build)
+        except Exception as e:
+            return None, e, await speculative
+        
+        speculative.cancel()
+        try:
+            await speculative
+        except asyncio.CancelledError:
+            pass
+        return result, None, None
+
+    async def agenerate_alternative(self, project_context, current_dockerfile):
+        """Asks for one more Dockerfile at ALTERNATIVE_TEMPERATURE.
+
+        Returns None if the answer is unusable or the same as current_dockerfile.
+        """
         try:
-            response = self._ask_llm_with_retry(messages)
+            response = await self._acall(self._generate_messages(project_context), temperature=ALTERNATIVE_TEMPERATURE)
+            content = self._clean_llm_output(response.choices[0].message.content)
+        except Exception:
+            return None
+        return None if content == current_dockerfile else content
+
+    def generate_candidates(self, project_context, n=3):
+        """Sync wrapper around agenerate_candidates."""
+        return self._run(self.agenerate_candidates(project_context, n))
+
+    async def agenerate_candidates(self, project_context, n=3):
+        """Asks for up to n Dockerfiles at once, one per CANDIDATE_TEMPERATURES entry.
+
+        Returns the distinct valid candidates in temperature order (possibly fewer
+        than n). Raises if none of the answers is a usable Dockerfile.
+        """
+        messages = self._generate_messages(project_context)
+        temperatures = CANDIDATE_TEMPERATURES[:n]
+        responses = await asyncio.gather(
+            *(self._acall(messages, temperature=t) for t in temperatures),
+            return_exceptions=True
+        )
+        
+        candidates = []
+        errors = []
+        for response in responses:
+            try:
+                if isinstance(response, Exception):
+                    raise response
+                content = self._clean_llm_output(response.choices[0].message.content)
+            except Exception as e:
+                errors.append(e)
+                continue
+            if content not in candidates: # Identical answers would just build twice
+                candidates.append(content)
+        
+        if not candidates:
+            raise Exception(f"No usable Dockerfile among {len(temperatures)} candidates: {errors[0]}")
+        return candidates
+
+    async def agenerate_dockerfile(self, project_context, output_path=None):
+        """Sends project context to LLM and extracts the Dockerfile code.
+
+        If output_path is given, tokens are written there as they stream in and
+        the file is rewritten with the cleaned Dockerfile once the stream ends.
+        """
+        messages = self._generate_messages(project_context)
+        cache_key = self._cache_key(GENERATE_SYSTEM_PROMPT, messages[1]["content"])
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            if output_path:
+                with open(output_path, "w") as f:
+                    f.write(cached)
+            return cached
+
+        try:
+            response = await self._acall(messages, stream=True)
+            raw_content = await self._consume_stream(response, output_path)
             
-            dockerfile_content = response.choices[0].message.content
-            return self._clean_llm_output(dockerfile_content)
+            dockerfile_content = self._clean_llm_output(raw_content)
+            if output_path:
+                with open(output_path, "w") as f:
+                    f.write(dockerfile_content)
+            self._cache_put(cache_key, dockerfile_content)
+            return dockerfile_content
         except Exception as e:
             return f"Error generating Dockerfile: {str(e)}"
 
+    async def _consume_stream(self, response, output_path=None):
+        """Collects a streamed completion, mirroring each token to output_path if given."""
+        chunks = []
+        sink = open(output_path, "w") if output_path else None
+        try:
+            async for chunk in response:
+                token = chunk.choices[0].delta.content or ""
+                chunks.append(token)
+                if sink:
+                    sink.write(token)
+        finally:
+            if sink:
+                sink.close()
+        return "".join(chunks)
+
     def _clean_llm_output(self, text):
         """Removes markdown backticks if the LLM ignores instructions."""
-        # Step 1: Remove markdown code blocks
-        if "```dockerfile" in text:
-            text = text.split("```dockerfile")[1].split("```")[0]
-        elif "```" in text:
-            parts = text.split("```")
-            if len(parts) >= 3:
-                text = parts[1]
+        # Step 1: Remove markdown code blocks (one regex pass handles both fence styles)
+        match = _FENCE_RE.search(text)
+        if match:
+            text = match.group(1)
         
         # Step 2: Only keep lines that start with valid Docker instructions
         # This prevents "Error:" or "Here is the fix:" from being included
-        valid_instructions = ("FROM", "RUN", "COPY", "WORKDIR", "CMD", "ENTRYPOINT", "EXPOSE", "ENV", "ARG", "LABEL", "USER", "VOLUME", "HEALTHCHECK", "#")
-        lines = text.strip().split("\n")
-        cleaned_lines = []
-        
-        for line in lines:
-            stripped = line.strip()
-            # Keep lines that start with valid instructions OR continuation lines (indented)
-            if stripped and (stripped.upper().startswith(valid_instructions) or line.startswith(" ") or line.startswith("\t")):
-                cleaned_lines.append(line)
+        # Keep lines that start with valid instructions OR continuation lines (indented),
+        # found in a single regex scan instead of strip/upper/startswith per line
+        cleaned_lines = [m.group(0) for m in _INSTRUCTION_LINE_RE.finditer(text.strip())]
         
         result = "\n".join(cleaned_lines).strip()
         
@@ -204,135 +1037,268 @@ class LLMArchitect:
         return result
 
     def heal_dockerfile(self, project_context, faulty_dockerfile, error_log):
-        """Asks the LLM to fix a Dockerfile that failed to build."""
-        system_prompt = (
-            "You are a Senior DevOps Engineer. A Dockerfile failed to build.\n"
-            "CRITICAL RULES:\n"
-            "1. Only COPY files that are explicitly listed in 'FILES THAT ACTUALLY EXIST' section.\n"
-            "2. If a file like requirements.txt is missing, do NOT attempt to use it.\n"
-            "3. Look for alternatives: pyproject.toml, setup.py, or use 'pip install .' for Python projects.\n"
-            "4. If the error mentions a missing file, CHECK if it's in the 'MISSING STANDARD FILES' list.\n"
-            "5. IMPORTANT: If the error is 'FileNotFoundError' for README.rst, README.md, LICENSE, or similar:\n"
-            "   - These files exist in the project but weren't copied into the Docker image.\n"
-            "   - Check the ROOT DIRECTORY FILES list to see what needs to be copied.\n"
-            "   - Use 'COPY . .' to copy everything OR explicitly add 'COPY README.* ./' and 'COPY LICENSE ./'.\n"
-            "6. Modern Python build backends (flit, poetry, setuptools) often require README and LICENSE files.\n"
-            "7. Return ONLY the fixed Dockerfile content. No explanations, no markdown, no 'Here is the fix' preamble."
-        )
+        """Sync wrapper around aheal_dockerfile."""
+        return self._run(self.aheal_dockerfile(project_context, faulty_dockerfile, error_log))
 
+    async def aheal_dockerfile(self, project_context, faulty_dockerfile, error_log):
+        """Asks the LLM to fix a Dockerfile that failed to build."""
+        # Static instructions first, then the per-project context, then what changes per attempt,
+        # so providers with prefix caching can reuse as much of the prompt as possible
         user_prompt = (
+            "Analyze the error and fix the Dockerfile. If files are missing from the image, add COPY commands for them. "
+            "Return ONLY valid Dockerfile code.\n\n"
             f"=== PROJECT CONTEXT (SOURCE OF TRUTH) ===\n{project_context}\n\n"
             f"=== FAULTY DOCKERFILE ===\n{faulty_dockerfile}\n\n"
-            f"=== DOCKER BUILD ERROR ===\n{error_log}\n\n"
-            "Analyze the error and fix the Dockerfile. If files are missing from the image, add COPY commands for them. "
-            "Return ONLY valid Dockerfile code."
+            f"=== DOCKER BUILD ERROR ===\n{error_log}"
         )
         
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
-        
         try:
-            response = self._ask_llm_with_retry(messages)
-            
-            return self._clean_llm_output(response.choices[0].message.content)
+            return await self._acomplete(HEAL_BUILD_SYSTEM_PROMPT, user_prompt)
         except Exception as e:
             return f"Error healing Dockerfile: {str(e)}"
 
     def heal_runtime(self, project_context, current_dockerfile, runtime_error_log):
-        """Asks the LLM to fix a Dockerfile that builds but fails at runtime."""
-        
-        system_prompt = (
-            "You are a Senior DevOps Engineer. A Docker image BUILT successfully, but FAILED when running.\n"
-            "CRITICAL ANALYSIS REQUIRED:\n"
-            "1. Determine if this is a LIBRARY (like Flask, Bottle, Django libs) or an APPLICATION.\n"
-            "2. For LIBRARIES: The CMD should be a simple validation like 'python -c \"import X; print(X.__version__)\"'\n"
-            "3. For APPLICATIONS: Fix the entry point (e.g., correct the path to main.py, add ENTRYPOINT).\n"
-            "4. Common runtime errors:\n"
-            "   - 'executable file not found' → Use full command: CMD [\"python\", \"script.py\"] not CMD [\"script.py\"]\n"
-            "   - 'No application entry point specified' → Library project, use import test\n"
-            "   - 'ModuleNotFoundError' → Missing dependency or wrong WORKDIR\n"
-            "   - 'Permission denied' → Add executable permissions or fix user\n"
-            "5. Return ONLY the fixed Dockerfile content. No explanations, no markdown, no preamble."
-        )
+        """Sync wrapper around aheal_runtime."""
+        return self._run(self.aheal_runtime(project_context, current_dockerfile, runtime_error_log))
 
+    async def aheal_runtime(self, project_context, current_dockerfile, runtime_error_log):
+        """Asks the LLM to fix a Dockerfile that builds but fails at runtime."""
+        # Same ordering as heal_dockerfile: stable prefix first, per-attempt details last
         user_prompt = (
+            "The image builds fine but crashes when running. Fix the CMD/ENTRYPOINT to make it work. "
+            "Return ONLY valid Dockerfile code.\n\n"
             f"=== PROJECT CONTEXT ===\n{project_context}\n\n"
             f"=== CURRENT DOCKERFILE (builds successfully) ===\n{current_dockerfile}\n\n"
-            f"=== RUNTIME ERROR LOG ===\n{runtime_error_log}\n\n"
-            "The image builds fine but crashes when running. Fix the CMD/ENTRYPOINT to make it work. "
-            "Return ONLY valid Dockerfile code."
+            f"=== RUNTIME ERROR LOG ===\n{runtime_error_log}"
         )
 
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
-
         try:
-            response = self._ask_llm_with_retry(messages)
-            
-            return self._clean_llm_output(response.choices[0].message.content)
+            return await self._acomplete(HEAL_RUNTIME_SYSTEM_PROMPT, user_prompt)
         except Exception as e:
             return f"Error healing runtime: {str(e)}"
         
 ## Feature 2 / Task 1
+_client_singleton = None
+# The HTTP response of the last request made on each thread (see _remember_response)
+_last_response = threading.local()
+
+
+def _remember_response(response, *args, **kwargs):
+    """requests hook: records the response so a build's stream can be closed from another thread."""
+    _last_response.value = response
+    return response
+
+
+class _BuildCancel:
+    """Stops in-flight builds by closing their HTTP streams.
+
+    Closing the connection interrupts the builder thread's blocking read, and
+    the daemon aborts a build once its client has gone away.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._responses = []
+        self._cancelled = False
+
+    def register(self, response):
+        with self._lock:
+            if not self._cancelled:
+                self._responses.append(response)
+                return
+        response.close()
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            responses, self._responses = self._responses, []
+        for response in responses:
+            response.close()
+
+    def is_set(self):
+        return self._cancelled
+
+
+def _split_tag(tag):
+    """Splits 'repo:tag' into (repo, tag), defaulting to 'latest'. A registry port is not a tag."""
+    repo, sep, name = tag.rpartition(':')
+    if not sep or '/' in name:
+        return tag, 'latest'
+    return repo, name
+
+
+def _get_client():
+    """Returns the process-wide Docker client, connecting on first use."""
+    global _client_singleton
+    if _client_singleton is None:
+        # A bounded timeout so a hung daemon call can't block forever, and a pool big
+        # enough for back-to-back build / run / wait calls during heal loops
+        _client_singleton = docker.from_env(timeout=DOCKER_TIMEOUT, max_pool_size=DOCKER_POOL_SIZE)
+        # APIClient is a requests.Session; the hook exposes each build's response for cancelling
+        _client_singleton.api.hooks['response'].append(_remember_response)
+    return _client_singleton
+
+
 class DockerBuilder:
     def __init__(self):
         try:
-            self.client = docker.from_env()
+            self.client = _get_client()
+            self.api = self.client.api
             self.client.ping()
         except Exception as e:
             raise Exception("Docker is not running. Please start Docker Desktop.")
 
-    def build_image(self, path, tag="auto-docker-app:latest"):
-        """Builds a docker image from the provided directory path."""
-        print(f"Building image: {tag}...")
+    def build_image(self, path, tag="auto-docker-app:latest", dockerfile="Dockerfile", verbose=True, cancel=None):
+        """Builds a docker image from the provided directory path.
+
+        Uses the low-level API so log lines are printed as the daemon sends them,
+        and only the tail of the log is ever held in memory for the error report.
+        With verbose=False nothing is printed. cancel is a _BuildCancel that can
+        stop the build from another thread.
+        """
+        if verbose:
+            print(f"Building image: {tag}...")
+        
+        build_stream = self.api.build(
+            path=path,
+            tag=tag,
+            dockerfile=dockerfile,
+            rm=True,       # Remove intermediate containers
+            forcerm=True,  # Always remove intermediate containers
+            decode=True
+        )
+        if cancel is not None:
+            # api.build has sent the request on this thread, so this is its response
+            cancel.register(_last_response.value)
         
+        # Print build logs to show progress, flushing in batches instead of per line.
+        # The healer only needs the tail, so never hold more than BUILD_ERROR_LOG_SIZE chars
+        # (as (line, raw chunk) pairs).
+        tail = deque()
+        tail_size = 0
+        failed = False
+        write = sys.stdout.write
         try:
-            image, build_logs = self.client.images.build(
-                path=path,
-                tag=tag,
-                rm=True,      # Remove intermediate containers
-                forcerm=True  # Always remove intermediate containers
-            )
-            
-            # Print build logs to show progress
-            for line in build_logs:
-                if 'stream' in line:
-                    print(line['stream'].strip())
-            
-            return image
-        except docker.errors.BuildError as e:
-            print("Build Failed!")
-            # EXTRACT ONLY THE USEFUL ERROR INFO
-            # We filter for 'error' keys or take the last 20 lines of the stream
-            raw_logs = [str(log.get('stream', '').strip()) or str(log.get('error', '')) for log in e.build_log]
-            
-            # Keep only the last 20 lines to save tokens
-            clean_log = "\n".join([l for l in raw_logs if l])[-4000:] 
+            for count, chunk in enumerate(build_stream, 1):
+                if 'error' in chunk:
+                    failed = True
+                    line = chunk['error'].rstrip()
+                else:
+                    stream = chunk.get('stream')
+                    if stream is None:
+                        continue # aux / progress entries
+                    line = stream.rstrip()
+                    if verbose:
+                        write(f"{line.strip()}\n")
+                        if count % LOG_FLUSH_EVERY == 0:
+                            sys.stdout.flush()
+                if line:
+                    tail.append((line, chunk))
+                    tail_size += len(line) + 1
+                    # Drop old lines only while the rest still fills the cap; the join below trims the excess
+                    while tail_size - len(tail[0][0]) - 1 >= BUILD_ERROR_LOG_SIZE:
+                        tail_size -= len(tail.popleft()[0]) + 1
+        except Exception:
+            if cancel is None or not cancel.is_set():
+                raise
+        sys.stdout.flush()
+        
+        # A closed stream can also just end early, so check even without an exception
+        if cancel is not None and cancel.is_set():
+            raise Exception(f"Build of {tag} cancelled")
+        
+        if failed:
+            if verbose:
+                print("Build Failed!")
+            # Cap the size to save tokens
+            clean_log = "\n".join(line for line, _ in tail)[-BUILD_ERROR_LOG_SIZE:]
+            # build_log holds the raw decoded chunks, like docker-py's own BuildError
+            raise docker.errors.BuildError(f"Build Error (Truncated): {clean_log}", [chunk for _, chunk in tail])
+        
+        return self.client.images.get(tag)
+
+    def build_candidates(self, path, dockerfiles, tag="auto-docker-app:latest"):
+        """Builds candidate Dockerfiles concurrently and keeps the first one that succeeds.
+
+        Each candidate is written to Dockerfile.cand-<i> and built as <repo>:cand-<i>.
+        The winner is also tagged as tag and the other builds are stopped. The
+        candidate files and cand-<i> tags are removed afterwards. Returns
+        (index, image), or raises the first candidate's build error if none builds.
+        """
+        repo, tag_name = _split_tag(tag)
+        cancel = _BuildCancel()
+        errors = {}
+        futures = {}
+        
+        executor = ThreadPoolExecutor(max_workers=len(dockerfiles))
+        try:
+            for i, content in enumerate(dockerfiles):
+                name = f"Dockerfile.cand-{i}"
+                with open(os.path.join(path, name), "w") as f:
+                    f.write(content)
+                # Quiet: several interleaved build logs are unreadable
+                future = executor.submit(self.build_image, path, f"{repo}:cand-{i}", name, False, cancel)
+                futures[future] = i
             
-            raise Exception(f"Build Error (Truncated): {clean_log}")
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = futures[future]
+                    try:
+                        image = future.result()
+                    except Exception as e:
+                        errors[i] = e
+                        continue
+                    cancel.cancel()
+                    self.api.tag(image.id, repo, tag_name)
+                    return i, self.client.images.get(tag)
+        finally:
+            cancel.cancel()
+            # The losers' streams are closed, so this only waits for them to notice
+            executor.shutdown(wait=True)
+            self._remove_candidates(path, repo, len(dockerfiles))
+        
+        raise errors[min(errors)]
+
+    def _remove_candidates(self, path, repo, count):
+        """Deletes the Dockerfile.cand-<i> files and <repo>:cand-<i> tags left by a race."""
+        for i in range(count):
+            try:
+                os.remove(os.path.join(path, f"Dockerfile.cand-{i}"))
+            except OSError:
+                pass
+            try:
+                # Only untags the winner (it keeps the real tag); deletes a loser that finished anyway
+                self.api.remove_image(f"{repo}:cand-{i}")
+            except docker.errors.APIError:
+                pass # Never built, or stopped before tagging
         
     def test_run(self, image_tag, timeout=10):
         """Starts the container briefly to ensure it doesn't crash on boot."""
-        print(f"Testing container stability for {timeout} seconds...")
+        print(f"Testing container stability for up to {timeout} seconds...")
         container = None
         try:
             # Run the container in detached mode
             container = self.client.containers.run(image_tag, detach=True)
             
-            # Wait to see if it stays 'running'
-            import time
-            time.sleep(timeout)
+            # Wait to see if it stays 'running'. Returns as soon as the container exits,
+            # so a crash on boot is reported right away instead of after the full window.
+            try:
+                self.api.wait(container.id, timeout=timeout, condition='not-running')
+            except (requests.exceptions.ReadTimeout, requests.exceptions.ConnectionError):
+                pass # Still running when the window closed
             
             container.reload() # Refresh container status
             
             # GET THE EXIT CODE
-            exit_code = container.attrs['State']['ExitCode']
+            state = container.attrs['State']
+            exit_code = state['ExitCode']
             logs = container.logs().decode("utf-8").strip()
 
+            if state.get('OOMKilled'):
+                # Same signal as the 'oom' event; the logs usually just stop, so say why
+                raise Exception(f"Container was killed for running out of memory (Exit {exit_code}). Logs: {logs}")
             if container.status == "running":
                 print("Container is stable and running.")
                 return True
@@ -347,5 +1313,9 @@ class DockerBuilder:
             raise e
         finally:
             if container:
-                container.stop()
-                container.remove()
+                # SIGKILL + remove in one call; the test container is disposable,
+                # so there's no point waiting on a graceful stop
+                try:
+                    container.remove(force=True)
+                except docker.errors.NotFound:
+                    pass
@@ -2,18 +2,17 @@
 import argparse
 import os
 import sys
-import time
 import colorama
+from concurrent.futures import ThreadPoolExecutor
 from rich.console import Console
 from rich.panel import Panel
-from rich.status import Status
 from rich.syntax import Syntax
 from rich_argparse import RichHelpFormatter
 from .core import WorkspaceManager, LLMArchitect, DockerBuilder
 
 console = Console()
 
-def run_auto_docker(source, model_name, tag, skip_test):
+def run_auto_docker(source, model_name, tag, skip_test, use_cache=True, candidates=1, speculate=False):
     """Main containerization logic with rich output."""
     
     # Validate source exists
@@ -21,29 +20,45 @@ def run_auto_docker(source, model_name, tag, skip_test):
         console.print(f"[bold red]Error:[/bold red] File '{source}' not found.")
         return None
     
+    # Connect to Docker (ping + handshake) while the workspace and LLM steps run,
+    # so the connection is already warm when the build starts
+    docker_connect = ThreadPoolExecutor(max_workers=1)
+    builder_future = docker_connect.submit(DockerBuilder)
+    docker_connect.shutdown(wait=False)
+    
     with console.status("[bold green]Working...") as status:
         
         # 1. Setup Workspace
         workspace = WorkspaceManager(source)
-        if source.startswith("http"):
+        if workspace.is_git:
             status.update(f"[bold yellow]Cloning repository from GitHub...")
-            temp_path = workspace.setup_from_github(source) # Call our new Git method
         else:
             status.update("[bold yellow]Unpacking local zip file...")
-            temp_path = workspace.setup() # Call the original Zip method
+        temp_path = workspace.setup() # Clones or unzips, depending on the source
             
         console.print(f"[green]Workspace ready at:[/green] [dim]{temp_path}[/dim]")
         
         try:
             # 2. Extract Context
             status.update("[bold yellow]Extracting project context...")
-            context = workspace.get_context_for_llm()
+            context = workspace.get_context_for_llm(model=model_name)
             console.print("[green]Context extracted[/green] ")
             
             # 3. Consult the Architect (LLM)
             status.update(f"[bold blue]Architecting via {model_name}...")
-            architect = LLMArchitect(model=model_name)
-            dockerfile_content = architect.generate_dockerfile(context)
+            architect = LLMArchitect(model=model_name, use_cache=use_cache)
+            dockerfile_path = os.path.join(temp_path, "Dockerfile")
+            if candidates > 1:
+                # Several answers at different temperatures; the builds race below
+                dockerfile_candidates = architect.generate_candidates(context, n=candidates)
+                dockerfile_content = dockerfile_candidates[0]
+                with open(dockerfile_path, "w") as f:
+                    f.write(dockerfile_content)
+                console.print(f"[green]{len(dockerfile_candidates)} candidate Dockerfile(s) generated[/green]")
+            else:
+                # Streams straight into the Dockerfile as tokens arrive
+                dockerfile_content = architect.generate_dockerfile(context, output_path=dockerfile_path)
+                dockerfile_candidates = [dockerfile_content]
 
             if "RateLimitError" in dockerfile_content or "AuthenticationError" in dockerfile_content:
                 console.print("[bold red]LLM Provider Error:[/bold red] You are being rate limited. Please wait 60 seconds.")
@@ -53,11 +68,7 @@ def run_auto_docker(source, model_name, tag, skip_test):
                 console.print("[bold red]LLM Auth Failed:[/bold red] Check your GROQ_API_KEY.")
                 return None
             
-            # 4. Write the Dockerfile
-            dockerfile_path = os.path.join(temp_path, "Dockerfile")
-            with open(dockerfile_path, "w") as f:
-                f.write(dockerfile_content)
-            
+            # 4. The Dockerfile was written while streaming
             console.print("[green]Dockerfile generated[/green]")
             
             # Display the Dockerfile with syntax highlighting
@@ -71,10 +82,45 @@ def run_auto_docker(source, model_name, tag, skip_test):
             return None
         
         # 5. Build the Image (with Self-Healing)
-        builder = DockerBuilder()
         try:
-            status.update(f"[bold magenta]Building Docker image: {tag} (this may take a minute)...")
-            image = builder.build_image(temp_path, tag=tag)
+            builder = builder_future.result() # Re-raises if Docker isn't running
+        except Exception as e:
+            console.print(f"[bold red]Docker unavailable:[/bold red] {e}")
+            workspace.cleanup()
+            return None
+        workspace.write_dockerignore() # Keeps .git / venvs / caches out of the context sent to the daemon
+        try:
+            if len(dockerfile_candidates) > 1:
+                status.update(f"[bold magenta]Racing {len(dockerfile_candidates)} candidate builds for {tag}...")
+                winner, image = builder.build_candidates(temp_path, dockerfile_candidates, tag=tag)
+                dockerfile_content = dockerfile_candidates[winner]
+                with open(dockerfile_path, "w") as f:
+                    f.write(dockerfile_content)
+                console.print(f"[green]Candidate {winner + 1} built first[/green]")
+            elif speculate:
+                # A fallback Dockerfile is drafted while the first build runs, so a failure
+                # can be retried without waiting on the LLM
+                status.update(f"[bold magenta]Building Docker image: {tag} (drafting a fallback meanwhile)...")
+                image, build_error, alternative = architect.speculate_build(
+                    lambda: builder.build_image(temp_path, tag=tag), context, dockerfile_content
+                )
+                if build_error is not None and alternative:
+                    console.print("[yellow]Initial build failed. Trying the fallback Dockerfile...[/yellow]")
+                    with open(dockerfile_path, "w") as f:
+                        f.write(alternative)
+                    try:
+                        image = builder.build_image(temp_path, tag=tag)
+                        dockerfile_content = alternative
+                        build_error = None
+                    except Exception:
+                        # Heal the original against its own error
+                        with open(dockerfile_path, "w") as f:
+                            f.write(dockerfile_content)
+                if build_error is not None:
+                    raise build_error
+            else:
+                status.update(f"[bold magenta]Building Docker image: {tag} (this may take a minute)...")
+                image = builder.build_image(temp_path, tag=tag)
             console.print(f"[green]Image built successfully![/green] [dim]ID: {image.id[:12]}[/dim]")
             
         except Exception as e:
@@ -84,11 +130,8 @@ def run_auto_docker(source, model_name, tag, skip_test):
             status.update("[bold yellow]Self-healing Dockerfile...")
             error_log = str(e)
             
-            with open(dockerfile_path, "r") as f:
-                faulty_content = f.read()
-                
             try:
-                fixed_content = architect.heal_dockerfile(context, faulty_content, error_log)
+                fixed_content = architect.heal_dockerfile(context, dockerfile_content, error_log)
                 
                 # Validate the fixed content
                 if not fixed_content or "Error" in fixed_content[:50]:
@@ -98,6 +141,7 @@ def run_auto_docker(source, model_name, tag, skip_test):
                 
                 with open(dockerfile_path, "w") as f:
                     f.write(fixed_content)
+                dockerfile_content = fixed_content
                 
                 console.print("[yellow]→[/yellow] Applied fix, retrying build...")
                 
@@ -124,14 +168,11 @@ def run_auto_docker(source, model_name, tag, skip_test):
                 console.print(f"[yellow]Attempting runtime healing...[/yellow]")
                 
                 status.update("[bold yellow]Healing runtime configuration...")
-                
-                with open(dockerfile_path, "r") as f:
-                    current_dockerfile = f.read()
 
                 try:
                     fixed_runtime_content = architect.heal_runtime(
                         context, 
-                        current_dockerfile, 
+                        dockerfile_content, 
                         runtime_log
                     )
                     
@@ -144,6 +185,7 @@ def run_auto_docker(source, model_name, tag, skip_test):
                     # Write the fixed Dockerfile
                     with open(dockerfile_path, "w") as f:
                         f.write(fixed_runtime_content)
+                    dockerfile_content = fixed_runtime_content
                     
                     console.print("[yellow]→[/yellow] Applied runtime fix, rebuilding...")
                     
@@ -212,6 +254,12 @@ def cli_entry():
                       help="Docker image tag (default: auto-docker-test:latest)")
     group.add_argument("--skip-test", action="store_true", 
                       help="Skip runtime stability check")
+    group.add_argument("--no-cache", action="store_true",
+                      help="Ignore cached LLM answers and ask the model again")
+    group.add_argument("--candidates", type=int, default=1, choices=range(1, 5), metavar="N",
+                      help="Generate N Dockerfiles (1-4) and keep the first that builds (default: 1)")
+    group.add_argument("--speculate", action="store_true",
+                      help="Draft a fallback Dockerfile during the first build, tried before self-healing")
 
     args = parser.parse_args()
 
@@ -223,7 +271,8 @@ def cli_entry():
     ))
 
     # Run the main logic
-    result = run_auto_docker(args.source, args.model, args.tag, args.skip_test)
+    result = run_auto_docker(args.source, args.model, args.tag, args.skip_test,
+                             use_cache=not args.no_cache, candidates=args.candidates, speculate=args.speculate)
     
     # Exit with appropriate code
     sys.exit(0 if result else 1)